@@ -1,21 +1,33 @@
 """Main Telegram bot implementation."""
-from dotenv import load_dotenv
-load_dotenv() # Load environment variables FIRST
-
-import logging
 import os
+# Load .env FIRST when there is one; it never overrides variables already set
+_ENV_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env")
+if os.path.exists(_ENV_FILE):
+    from dotenv import load_dotenv
+    load_dotenv(_ENV_FILE)
+
+import asyncio
+import hashlib
+import logging
+import time
+import weakref
+from collections import OrderedDict
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
 from telegram.ext import (
+    AIORateLimiter,
     Application,
+    BaseUpdateProcessor,
     CommandHandler,
     CallbackQueryHandler,
     MessageHandler,
     ConversationHandler,
     ContextTypes,
+    PicklePersistence,
     filters
 )
 import functools
-import config
+from itertools import groupby, zip_longest
+from operator import attrgetter
 import config
 from database import Database
 
@@ -23,7 +35,7 @@ from database import Database
 # Enable logging
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
+    level=getattr(logging, config.LOG_LEVEL, logging.INFO)
 )
 logger = logging.getLogger(__name__)
 
@@ -34,16 +46,133 @@ logging.getLogger('httpx').setLevel(logging.WARNING)
 CHOOSING_DEPARTMENT, ENTERING_NAME = range(2)
 CAT_MANAGE_ACTION, CAT_ADDING, CAT_RENAMING_SELECT, CAT_RENAMING_NEW_NAME, CAT_DELETING_SELECT, CAT_DELETING_CONFIRM = range(2, 8)
 
+# Main menu keyboard, built once since its labels never change
+MAIN_KEYBOARD = ReplyKeyboardMarkup(
+    [
+        [
+            KeyboardButton(config.BUTTON_ADD_ITEM),
+            KeyboardButton(config.BUTTON_SHOW_LIST),
+            KeyboardButton(config.BUTTON_TOGGLE_BOUGHT)
+        ],
+        [
+            KeyboardButton(config.BUTTON_MANAGE_CATS),
+            KeyboardButton(config.BUTTON_SHARE_LIST)
+        ]
+    ],
+    resize_keyboard=True,
+    is_persistent=True
+)
+
+# Category management menu, likewise static
+CATEGORY_MENU_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("➕ Добавить категорию", callback_data="cat_add")],
+    [InlineKeyboardButton("✏️ Переименовать категорию", callback_data="cat_rename")],
+    [InlineKeyboardButton("🗑 Удалить категорию", callback_data="cat_delete")],
+    [InlineKeyboardButton("⬅️ Назад", callback_data="cancel")]
+])
+
+# Static inline buttons reused by every list render
+BTN_BACK_CATS = InlineKeyboardButton("⬅️ Назад к категориям", callback_data="list_cats")
+BTN_EDIT_ON = InlineKeyboardButton("⚙️ Удаление", callback_data="e")
+BTN_EDIT_OFF = InlineKeyboardButton("✅ Готово", callback_data="e")
+BTN_SHOW_ALL = InlineKeyboardButton("📝 Показать всё", callback_data="a")
+BTN_MANAGE_CATS = InlineKeyboardButton("⚙️ Управление категориями", callback_data="manage_cats_inline")
+BTN_BACK_TO_MENU = InlineKeyboardButton("⬅️ Назад", callback_data="back_to_menu")
+EMPTY_CATEGORY_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Назад", callback_data="list_cats")]])
+
+# Local alias for the access check that runs on every update
+_ALLOWED = config.ALLOWED_USERS
+# Same check applied by PTB at dispatch time, before any handler coroutine runs
+ALLOW_FILTER = filters.User(user_id=_ALLOWED)
+
+# Main menu button filters, built once; exact text matches, no regex
+_ADD_ITEM_FILTER = ALLOW_FILTER & filters.Text([config.BUTTON_ADD_ITEM])
+_MANAGE_CATS_FILTER = ALLOW_FILTER & filters.Text([config.BUTTON_MANAGE_CATS])
+
 # Initialize database
-db = Database(config.DATABASE_URL)
+db = Database(config.DATABASE_URL, pragmas=config.SQLITE_PRAGMAS)
+
+# Per-user read cache for list rendering: user_id -> {"ts": ..., key: value}
+CACHE_TTL = 30
+_cache = {}
+# Bumped on every mutation; part of the rendered-view cache key
+_items_version = 0
+
+# Items shown per page in list views
+PAGE_SIZE = 20
+
+
+async def run_db(func, *args, **kwargs):
+    """Run a blocking Database call in a worker thread to keep the event loop free."""
+    return await asyncio.to_thread(func, *args, **kwargs)
+
+
+async def _cached(user_id: int, key, loader):
+    """Return a cached value for the user, awaiting loader() on miss or expiry."""
+    now = time.monotonic()
+    entry = _cache.get(user_id)
+    if entry is None or now - entry["ts"] > CACHE_TTL:
+        entry = _cache[user_id] = {"ts": now}
+    if key not in entry:
+        entry[key] = await loader()
+    return entry[key]
+
+
+async def _cached_items(user_id: int, show_bought: bool, category=None):
+    """Get items for the user's list (or one category of it) through the cache."""
+    return await _cached(user_id, ("items", show_bought, category),
+                         lambda: run_db(db.get_items, user_id, include_bought=show_bought, category=category))
+
+
+async def _cached_items_grouped(user_id: int, show_bought: bool):
+    """Get items for the user's list in category order through the cache."""
+    return await _cached(user_id, ("items_grouped", show_bought),
+                         lambda: run_db(db.get_items_grouped, user_id, include_bought=show_bought))
+
+
+async def _cached_categories(user_id: int):
+    """Get all categories for the user's list through the cache."""
+    return await _cached(user_id, "cats", lambda: run_db(db.get_categories, user_id))
+
+
+async def _cached_categories_with_items(user_id: int, show_bought: bool):
+    """Get non-empty categories for the user's list through the cache."""
+    return await _cached(user_id, ("cats_with_items", show_bought),
+                         lambda: run_db(db.get_categories_with_items, user_id, include_bought=show_bought))
+
+
+async def _cached_invite_code(user_id: int):
+    """Get the invite code of the user's group through the cache."""
+    return await _cached(user_id, "invite", lambda: run_db(db.get_invite_code, user_id))
+
+
+# Cache keys that item writes (add/toggle/delete) cannot change
+_ITEM_INDEPENDENT_KEYS = ("ts", "cats", "invite")
+
+
+def _invalidate_cache(items_only=False):
+    """Drop cached reads after a mutation.
+
+    Lists are shared between group members, so a change made by one user
+    invalidates every cached view, not just their own. With items_only,
+    category lists and invite codes are kept, since only items changed.
+    """
+    global _items_version
+    _items_version += 1
+    if not items_only:
+        _cache.clear()
+        return
+    for user_id, entry in _cache.items():
+        _cache[user_id] = {k: entry[k] for k in _ITEM_INDEPENDENT_KEYS if k in entry}
+
 
 def restricted(func):
     """Decorator to check if user is allowed to use the bot."""
     @functools.wraps(func)
     async def wrapped(update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
         user_id = update.effective_user.id
-        if user_id not in config.ALLOWED_USERS:
-            logger.warning(f"Unauthorized access attempt by user {user_id}")
+        if user_id not in _ALLOWED:
+            logger.warning("Unauthorized access attempt by user %s", user_id)
             await update.effective_message.reply_text(config.MSG_ACCESS_DENIED)
             return ConversationHandler.END if isinstance(func, type(add_item_start)) else None
         return await func(update, context, *args, **kwargs)
@@ -52,36 +181,35 @@ def restricted(func):
 
 async def global_trace(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Log every incoming update for debugging."""
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
     if update.message:
-        logger.info(f"TRACE: Message from {update.effective_user.id}: {update.message.text}")
+        logger.debug("TRACE: Message from %s: %s", update.effective_user.id, update.message.text)
     elif update.callback_query:
-        logger.info(f"TRACE: Callback from {update.effective_user.id}: {update.callback_query.data}")
+        logger.debug("TRACE: Callback from %s: %s", update.effective_user.id, update.callback_query.data)
     else:
-        logger.info(f"TRACE: Unknown update type from {update.effective_user.id}")
+        logger.debug("TRACE: Unknown update type from %s", update.effective_user.id)
+
+async def access_denied(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Reply to messages from users outside ALLOWED_USERS."""
+    logger.warning("Unauthorized access attempt by user %s", update.effective_user.id)
+    await update.effective_message.reply_text(config.MSG_ACCESS_DENIED)
+
 
 def get_main_keyboard(context: ContextTypes.DEFAULT_TYPE = None):
     """Get the main menu keyboard."""
-    keyboard = [
-        [
-            KeyboardButton(config.BUTTON_ADD_ITEM),
-            KeyboardButton(config.BUTTON_SHOW_LIST),
-            KeyboardButton(config.BUTTON_TOGGLE_BOUGHT)
-        ],
-        [
-            KeyboardButton(config.BUTTON_MANAGE_CATS),
-            KeyboardButton(config.BUTTON_SHARE_LIST)
-        ]
-    ]
-    return ReplyKeyboardMarkup(keyboard, resize_keyboard=True, is_persistent=True)
+    return MAIN_KEYBOARD
 
 
-@restricted
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start command handler."""
-    logger.info(f"Start command from {update.effective_user.id}")
+    logger.info("Start command from %s", update.effective_user.id)
     
     # Seed data for the user on first start
-    db.seed_data(update.effective_user.id)
+    if not context.user_data.get("seeded"):
+        await run_db(db.seed_data, update.effective_user.id)
+        _invalidate_cache()
+        context.user_data["seeded"] = True
     
     msg = await update.message.reply_text(
         config.MSG_WELCOME,
@@ -91,24 +219,31 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data["keyboard_msg_id"] = msg.message_id
 
 
-@restricted
+def _dept_button(index: int, name: str) -> InlineKeyboardButton:
+    """Category button for the add flow, carrying the name itself when it fits."""
+    data = "dept|" + name
+    if len(data.encode()) > 64:
+        # Over Telegram's callback_data limit; fall back to the list position
+        data = f"dept_{index}"
+    return InlineKeyboardButton(name, callback_data=data)
+
+
 async def add_item_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start the add item flow."""
-    logger.info(f"Add item started by {update.effective_user.id}")
+    logger.info("Add item started by %s", update.effective_user.id)
     
-    categories = db.get_categories(update.effective_user.id)
+    categories = await _cached_categories(update.effective_user.id)
     if not categories:
         # Fallback if no categories exist
-        db.seed_data(update.effective_user.id)
-        categories = db.get_categories(update.effective_user.id)
-
-    keyboard = []
-    for i in range(0, len(categories), 2):
-        row = [InlineKeyboardButton(categories[i], callback_data=f"dept_{i}")]
-        if i + 1 < len(categories):
-            row.append(InlineKeyboardButton(categories[i+1], callback_data=f"dept_{i+1}"))
-        keyboard.append(row)
-    
+        await run_db(db.seed_data, update.effective_user.id)
+        _invalidate_cache()
+        categories = await _cached_categories(update.effective_user.id)
+    # Snapshot for resolving index-style buttons against what was shown
+    context.user_data["_cats_for_add"] = categories
+
+    # Two buttons per row
+    pairs = iter(enumerate(categories))
+    keyboard = [[_dept_button(*a)] + ([_dept_button(*b)] if b else []) for a, b in zip_longest(pairs, pairs)]
     keyboard.append([InlineKeyboardButton(config.BUTTON_CANCEL, callback_data="cancel")])
     
     await update.message.reply_text(
@@ -127,9 +262,13 @@ async def department_chosen(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.edit_message_text("Отменено.")
         return ConversationHandler.END
     
-    dept_index = int(query.data.split("_")[1])
-    categories = db.get_categories(update.effective_user.id)
-    department = categories[dept_index]
+    categories = context.user_data.pop("_cats_for_add", None)
+    if query.data.startswith("dept|"):
+        department = query.data[5:]
+    else:
+        dept_index = int(query.data.split("_")[1])
+        categories = categories or await _cached_categories(update.effective_user.id)
+        department = categories[dept_index]
     context.user_data["department"] = department
     
     await query.edit_message_text(
@@ -145,7 +284,8 @@ async def item_name_entered(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     
     if item_name and department:
-        db.add_item(user_id, item_name, department)
+        await run_db(db.add_item, user_id, item_name, department)
+        _invalidate_cache(items_only=True)
         await update.message.reply_text(config.MSG_ITEM_ADDED)
     
     # Targeted cleanup
@@ -169,7 +309,7 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return ConversationHandler.END
 
 
-async def list_items(update: Update, context: ContextTypes.DEFAULT_TYPE, category=None, force_new=False):
+async def list_items(update: Update, context: ContextTypes.DEFAULT_TYPE, category=None, force_new=False, page=0):
     """List shopping items. If category is None, show category selection."""
     user_id = update.effective_user.id
     show_bought = context.user_data.get("show_bought", False)
@@ -177,108 +317,232 @@ async def list_items(update: Update, context: ContextTypes.DEFAULT_TYPE, categor
     
     # Store current view context
     context.user_data["last_category"] = category
+    context.user_data["last_page"] = page
+    if category is None:
+        # Menu buttons carry category indices into this snapshot
+        context.user_data["cats"] = await _cached_categories(user_id)
     
+    # Rendered views are cached until the next mutation bumps the version
+    key = ("render", category, page, edit_mode, show_bought, _items_version)
+    view_id = _view_id(update)
+    if not force_new and _last_render_key.get(view_id) == key:
+        # The message already shows exactly this view
+        return
+    
+    message_text, reply_markup = await _cached(user_id, key, lambda: _render_view(user_id, category, page, show_bought, edit_mode))
+    if await send_or_edit(update, context, message_text, reply_markup=reply_markup, force_new=force_new):
+        _last_render_key[view_id] = key
+    else:
+        _last_render_key.pop(view_id, None)
+
+
+async def _render_view(user_id: int, category, page: int, show_bought: bool, edit_mode: bool):
+    """Build (text, reply_markup) for a list view."""
     if category == "ALL":
-        items = db.get_items(user_id, include_bought=show_bought)
-        if not items:
-            await send_or_edit(update, context, config.MSG_LIST_EMPTY, reply_markup=None, force_new=force_new)
-            return
+        return await _render_all(user_id, page, show_bought, edit_mode)
+    if category:
+        return await _render_category(user_id, category, page, show_bought, edit_mode)
+    return await _render_category_menu(user_id, show_bought)
+
+
+def _paginate(items: list, page: int):
+    """Clamp page to the available range and return (page, pages, page_items)."""
+    pages = max(1, -(-len(items) // PAGE_SIZE))
+    page = min(max(page, 0), pages - 1)
+    return page, pages, items[page * PAGE_SIZE:(page + 1) * PAGE_SIZE]
+
+
+def _page_nav_row(page: int, pages: int) -> list:
+    """Build the ◀ / ▶ row for a paginated view."""
+    row = []
+    if page > 0:
+        row.append(InlineKeyboardButton("◀", callback_data=f"p{page - 1}"))
+    if page < pages - 1:
+        row.append(InlineKeyboardButton("▶", callback_data=f"p{page + 1}"))
+    return row
+
+
+# Item status glyphs
+CHECK = "✅"
+EMPTY = "⬜️"
+
+# Pre-bound formatters for the per-item button loop
+_delete_label = "🗑 Удалить: ".__add__
+_bought_label = (CHECK + " ").__add__
+_pending_label = (EMPTY + " ").__add__
+_toggle_data = "t{}".format
+_delete_data = "d{}".format
+
 
-        grouped = {}
+def _append_item_rows(keyboard: list, items, edit_mode: bool):
+    """Append one button row per item; the hottest loop when rendering lists."""
+    IKB = InlineKeyboardButton
+    keyboard_append = keyboard.append
+    if edit_mode:
         for item in items:
-            dept = item["department"]
-            if dept not in grouped: grouped[dept] = []
-            grouped[dept].append(item)
-        
-        message_text = "📋 *Весь список:*\n"
-        if edit_mode: message_text += "⚠️ _Режим удаления_\n"
-            
-        # Navigation at TOP for long lists
-        keyboard = [[InlineKeyboardButton("⬅️ Назад к категориям", callback_data="list_cats")]]
-        mode_btn = InlineKeyboardButton("✅ Готово", callback_data="toggle_edit_all") if edit_mode else InlineKeyboardButton("⚙️ Удаление", callback_data="toggle_edit_all")
-        keyboard.append([mode_btn])
-        
-        categories = db.get_categories(user_id)
-        for dept in categories:
-            if dept not in grouped: continue
-            message_text += f"\n*{dept}*\n"
-            for item in grouped[dept]:
-                status = "✅" if item["is_bought"] else "⬜️"
-                if edit_mode:
-                    btn_text = f"🗑 Удалить: {item['name']}"
-                    keyboard.append([InlineKeyboardButton(btn_text, callback_data=f"del_{item['id']}_all")])
-                else:
-                    btn_text = f"{status} {item['name']}"
-                    keyboard.append([InlineKeyboardButton(btn_text, callback_data=f"tog_{item['id']}_all")])
-        
-        # Limit total buttons to 90 to stay safe (Telegram limit is ~100)
-        if len(keyboard) > 90:
-            keyboard = keyboard[:90]
-            message_text += "\n\n⚠️ _Список слишком длинный, показаны первые товары._"
+            keyboard_append([IKB(_delete_label(item.name), callback_data=_delete_data(item.id))])
+    else:
+        for item in items:
+            label = _bought_label if item.is_bought else _pending_label
+            keyboard_append([IKB(label(item.name), callback_data=_toggle_data(item.id))])
+
+
+async def _render_all(user_id: int, page: int, show_bought: bool, edit_mode: bool):
+    """Build one page of the view with every item grouped by category."""
+    # Rows arrive already ordered by category, so slice before building any buttons
+    items = await _cached_items_grouped(user_id, show_bought)
+    if not items:
+        return config.MSG_LIST_EMPTY, None
+
+    page, pages, page_items = _paginate(items, page)
+    
+    parts = ["📋 *Весь список:*\n"]
+    if edit_mode: parts.append("⚠️ _Режим удаления_\n")
+    if pages > 1: parts.append(f"_Страница {page + 1} из {pages}_\n")
         
-        # Bottom navigation too for convenience if not too many
-        if len(keyboard) < 88:
-            keyboard.append([mode_btn])
-            keyboard.append([InlineKeyboardButton("⬅️ Назад к категориям", callback_data="list_cats")])
+    # Navigation at TOP for long lists
+    keyboard = [[BTN_BACK_CATS]]
+    mode_btn = BTN_EDIT_OFF if edit_mode else BTN_EDIT_ON
+    keyboard.append([mode_btn])
+    
+    for dept, dept_items in groupby(page_items, key=attrgetter("department")):
+        parts.append(f"\n*{dept}*\n")
+        _append_item_rows(keyboard, dept_items, edit_mode)
+    
+    nav_row = _page_nav_row(page, pages)
+    if nav_row:
+        keyboard.append(nav_row)
+    
+    # Bottom navigation too for convenience
+    keyboard.append([mode_btn])
+    keyboard.append([BTN_BACK_CATS])
 
-        await send_or_edit(update, context, message_text, reply_markup=InlineKeyboardMarkup(keyboard), force_new=force_new)
-        return
+    return "".join(parts), InlineKeyboardMarkup(keyboard)
 
-    if category:
-        items = [i for i in db.get_items(user_id, include_bought=show_bought) if i["department"] == category]
-        if not items:
-            await send_or_edit(update, context, f"В категории *{category}* пусто.", 
-                              reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Назад", callback_data="list_cats")]]), force_new=force_new)
-            return
 
-        message_text = f"📂 *Категория:* {category}\n"
-        if edit_mode: message_text += "⚠️ _Режим удаления_\n"
-            
-        # Navigation at TOP
-        keyboard = [[InlineKeyboardButton("⬅️ Назад к категориям", callback_data="list_cats")]]
-        for item in items:
-            status = "✅" if item["is_bought"] else "⬜️"
-            if edit_mode:
-                btn_text = f"🗑 Удалить: {item['name']}"
-                keyboard.append([InlineKeyboardButton(btn_text, callback_data=f"del_{item['id']}_{category}")])
-            else:
-                btn_text = f"{status} {item['name']}"
-                keyboard.append([InlineKeyboardButton(btn_text, callback_data=f"tog_{item['id']}_{category}")])
+async def _render_category(user_id: int, category: str, page: int, show_bought: bool, edit_mode: bool):
+    """Build one page of the view with the items of a single category."""
+    items = await _cached_items(user_id, show_bought, category=category)
+    if not items:
+        return (f"В категории *{category}* пусто.",
+                EMPTY_CATEGORY_MARKUP)
+
+    page, pages, page_items = _paginate(items, page)
+
+    parts = [f"📂 *Категория:* {category}\n"]
+    if edit_mode: parts.append("⚠️ _Режим удаления_\n")
+    if pages > 1: parts.append(f"_Страница {page + 1} из {pages}_\n")
         
-        mode_btn = InlineKeyboardButton("✅ Готово", callback_data=f"toggle_edit_{category}") if edit_mode else InlineKeyboardButton("⚙️ Удаление", callback_data=f"toggle_edit_{category}")
-        keyboard.append([mode_btn])
-        keyboard.append([InlineKeyboardButton("⬅️ Назад к категориям", callback_data="list_cats")])
-        await send_or_edit(update, context, message_text, reply_markup=InlineKeyboardMarkup(keyboard), force_new=force_new)
-        return
+    # Navigation at TOP
+    keyboard = [[BTN_BACK_CATS]]
+    _append_item_rows(keyboard, page_items, edit_mode)
+    
+    nav_row = _page_nav_row(page, pages)
+    if nav_row:
+        keyboard.append(nav_row)
+    
+    mode_btn = BTN_EDIT_OFF if edit_mode else BTN_EDIT_ON
+    keyboard.append([mode_btn])
+    keyboard.append([BTN_BACK_CATS])
+    return "".join(parts), InlineKeyboardMarkup(keyboard)
+
 
+async def _render_category_menu(user_id: int, show_bought: bool):
+    """Build the category selection view."""
     # Category selection with navigation at TOP if many
     # Filter categories based on show_bought flag
-    categories = db.get_categories_with_items(user_id, include_bought=show_bought)
-    keyboard = []
-    if len(categories) > 6:
-        keyboard.append([InlineKeyboardButton("📝 Показать всё", callback_data="list_ALL")])
-    
-    for cat in categories:
-        keyboard.append([InlineKeyboardButton(cat, callback_data=f"list_{cat}")])
+    # Both reads are independent, so issue them together
+    categories, all_categories = await asyncio.gather(
+        _cached_categories_with_items(user_id, show_bought),
+        _cached_categories(user_id)
+    )
+    cat_index = {name: i for i, name in enumerate(all_categories)}
+    IKB = InlineKeyboardButton
+    all_row = [BTN_SHOW_ALL]
+    rows = [[IKB(cat, callback_data="l" + str(cat_index[cat]))] for cat in categories]
+    keyboard = ([all_row] if len(categories) > 6 else []) + rows + [all_row]
+    keyboard.append([BTN_MANAGE_CATS])
     
-    keyboard.append([InlineKeyboardButton("📝 Показать всё", callback_data="list_ALL")])
-    keyboard.append([InlineKeyboardButton("⚙️ Управление категориями", callback_data="manage_cats_inline")])
+    return "🗏 *Выберите категорию:*", InlineKeyboardMarkup(keyboard)
+
+
+
+
+# Markup of the current list message per (chat, user), for single-button patches
+_last_markup = {}
+# View key of the current list message per (chat, user); kept in memory because
+# _items_version restarts from zero with the process
+_last_render_key = {}
+
+
+def _view_id(update: Update):
+    """Key for one user's list message in one chat; users in a shared chat each have their own."""
+    return update.effective_chat.id, update.effective_user.id
+
+
+async def _patch_item_button(update: Update, context: ContextTypes.DEFAULT_TYPE, bought: bool) -> bool:
+    """Update just the tapped item button in the current list message.
     
-    await send_or_edit(update, context, "🗏 *Выберите категорию:*", reply_markup=InlineKeyboardMarkup(keyboard), force_new=force_new)
+    Returns False when the message can't be patched and needs a full render.
+    """
+    query = update.callback_query
+    view_id = _view_id(update)
+    markup = _last_markup.get(view_id)
+    if markup is None or query.message is None or query.message.message_id != context.user_data.get("last_list_msg_id"):
+        return False
+
+    rows = [list(row) for row in markup.inline_keyboard]
+    for row in rows:
+        for i, button in enumerate(row):
+            if button.callback_data != query.data:
+                continue
+            name = button.text.split(" ", 1)[1]
+            label = _bought_label if bought else _pending_label
+            row[i] = InlineKeyboardButton(label(name), callback_data=button.callback_data)
+            new_markup = InlineKeyboardMarkup(rows)
+            try:
+                await query.edit_message_reply_markup(reply_markup=new_markup)
+            except Exception as e:
+                logger.error("Failed to patch list keyboard: %s", e)
+                return False
+            _last_markup[view_id] = new_markup
+            # The stored digest no longer matches what the message shows
+            context.user_data.pop("last_render_hash", None)
+            return True
+    return False
+
+
+def _render_hash(text: str, reply_markup=None) -> bytes:
+    """Short digest of a rendered message used to detect no-op edits."""
+    payload = text + (reply_markup.to_json() if reply_markup else "")
+    return hashlib.blake2b(payload.encode(), digest_size=8).digest()
 
 
+async def _delete_message(context: ContextTypes.DEFAULT_TYPE, chat_id: int, message_id: int):
+    """Delete a message, logging instead of raising on failure."""
+    try:
+        await context.bot.delete_message(chat_id=chat_id, message_id=message_id)
+    except Exception as e:
+        logger.error("Failed to delete message %s: %s", message_id, e)
 
 
 async def send_or_edit(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str, reply_markup=None, force_new=False):
     """Helper to send a new message or edit the existing one, with tracking.
     
     NOTE: ReplyKeyboardMarkup is ONLY sent once at /start and never touched again.
+    
+    Returns:
+        True if the list message now shows the given content
     """
     try:
         last_msg_id = context.user_data.get("last_list_msg_id")
+        render_hash = _render_hash(text, reply_markup)
         
         # 1. Try to edit in-place if no force_new
         if last_msg_id and not force_new:
+            # Identical to what the message already shows: skip the API call
+            if context.user_data.get("last_render_hash") == render_hash:
+                return True
             try:
                 msg = await context.bot.edit_message_text(
                     chat_id=update.effective_chat.id,
@@ -288,46 +552,127 @@ async def send_or_edit(update: Update, context: ContextTypes.DEFAULT_TYPE, text:
                     reply_markup=reply_markup 
                 )
                 context.user_data["last_list_msg_id"] = msg.message_id
-                return
+                context.user_data["last_render_hash"] = render_hash
+                _last_markup[_view_id(update)] = reply_markup
+                return True
             except Exception:
                 pass
 
-        # 2. Delete old list message if exists (but NEVER delete the keyboard message)
-        keyboard_msg_id = context.user_data.get("keyboard_msg_id")
-        logger.info(f"send_or_edit: last_msg_id={last_msg_id}, keyboard_msg_id={keyboard_msg_id}")
-        if last_msg_id and last_msg_id != keyboard_msg_id:
-            logger.info(f"Deleting old list message: {last_msg_id}")
-            try: 
-                await context.bot.delete_message(chat_id=update.effective_chat.id, message_id=last_msg_id)
-            except Exception as e:
-                logger.error(f"Failed to delete message {last_msg_id}: {e}")
-        elif last_msg_id == keyboard_msg_id:
-            logger.info(f"Skipping deletion of keyboard message: {keyboard_msg_id}")
-
-        # 3. Send the new list message with inline buttons
+        # 2. Send the new list message with inline buttons
         msg = await context.bot.send_message(
             chat_id=update.effective_chat.id,
             text=text,
             parse_mode="Markdown",
             reply_markup=reply_markup
         )
+
+        # 3. Delete old list message in the background (but NEVER delete the keyboard message)
+        keyboard_msg_id = context.user_data.get("keyboard_msg_id")
+        logger.debug("send_or_edit: last_msg_id=%s, keyboard_msg_id=%s", last_msg_id, keyboard_msg_id)
+        if last_msg_id and last_msg_id != keyboard_msg_id:
+            logger.debug("Deleting old list message: %s", last_msg_id)
+            context.application.create_task(_delete_message(context, update.effective_chat.id, last_msg_id))
+        elif last_msg_id == keyboard_msg_id:
+            logger.debug("Skipping deletion of keyboard message: %s", keyboard_msg_id)
         context.user_data["last_list_msg_id"] = msg.message_id
+        context.user_data["last_render_hash"] = render_hash
+        _last_markup[_view_id(update)] = reply_markup
+        return True
             
     except Exception as e:
-        logger.error(f"Send/Edit error: {e}")
+        logger.error("Send/Edit error: %s", e)
+        return False
+
+
+# Pending debounced list renders: (chat_id, user_id) -> asyncio.Task
+RENDER_DEBOUNCE = 0.2
+_pending_render = {}
+
+
+async def _debounced_render(update: Update, context: ContextTypes.DEFAULT_TYPE, category, delay=RENDER_DEBOUNCE):
+    """Re-render the list after a short pause so rapid taps collapse into one edit."""
+    await asyncio.sleep(delay)
+    # Runs outside update processing, so take the chat's lock like a handler would
+    async with context.application.update_processor.chat_lock(update.effective_chat.id):
+        page = context.user_data.get("last_page", 0) if category == context.user_data.get("last_category") else 0
+        await list_items(update, context, category=category, page=page)
+
+
+def _schedule_render(update: Update, context: ContextTypes.DEFAULT_TYPE, category):
+    """Schedule a list re-render for the user's list, replacing any pending one."""
+    view_id = _view_id(update)
+    pending = _pending_render.get(view_id)
+    if pending and not pending.done():
+        pending.cancel()
+
+    # Tracked by PTB: errors reach the error handlers, shutdown waits for it
+    task = context.application.create_task(_debounced_render(update, context, category), update=update)
+    _pending_render[view_id] = task
+
+    def _forget(done_task):
+        if _pending_render.get(view_id) is done_task:
+            del _pending_render[view_id]
+    task.add_done_callback(_forget)
+
+
+# Batched writer for item mutations coming from button taps
+WRITE_BATCH_SIZE = 100
+_write_queue = None
+_writer_task = None
+
+
+async def _submit_write(op: str, item_id: int, user_id: int):
+    """Queue an item mutation for the batched writer and wait for its result."""
+    future = asyncio.get_running_loop().create_future()
+    await _write_queue.put((op, (item_id, user_id), future))
+    return await future
+
+
+async def _writer_loop():
+    """Drain queued mutations and commit each batch in one transaction."""
+    while True:
+        batch = [await _write_queue.get()]
+        while len(batch) < WRITE_BATCH_SIZE and not _write_queue.empty():
+            batch.append(_write_queue.get_nowait())
+        
+        try:
+            results = await run_db(db.apply_mutations, [(op, args) for op, args, _ in batch])
+        except Exception as e:
+            logger.error("Batched write of %s mutations failed: %s", len(batch), e)
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            continue
+        
+        for (_, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+async def post_init(application: Application):
+    """Start background tasks once the event loop is running."""
+    global _write_queue, _writer_task
+    _write_queue = asyncio.Queue()
+    _writer_task = asyncio.create_task(_writer_loop())
+
+
+async def post_shutdown(application: Application):
+    """Stop background tasks and release the database."""
+    if _writer_task:
+        _writer_task.cancel()
+    # Waits for any in-flight query to finish before closing
+    await run_db(db.close)
 
 
-@restricted
 async def show_list_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handler for the 'List' button."""
-    logger.info(f"Show list requested by {update.effective_user.id}")
+    logger.info("Show list requested by %s", update.effective_user.id)
     await list_items(update, context, force_new=True)
 
 
-@restricted
 async def toggle_view_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Toggle showing/hiding bought items from the main keyboard."""
-    logger.info(f"Toggle view requested by {update.effective_user.id}")
+    logger.info("Toggle view requested by %s", update.effective_user.id)
     
     # Delete the user's message to keep chat clean
     try: await update.message.delete()
@@ -341,25 +686,37 @@ async def toggle_view_handler(update: Update, context: ContextTypes.DEFAULT_TYPE
     await list_items(update, context, category=last_cat, force_new=True)
 
 
-@restricted
 async def share_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle the 'Share' button."""
-    logger.info(f"Share requested by {update.effective_user.id}")
-    invite_code = db.get_invite_code(update.effective_user.id)
+    logger.info("Share requested by %s", update.effective_user.id)
+    invite_code = await _cached_invite_code(update.effective_user.id)
     await update.message.reply_text(
         config.MSG_SHARE_INFO.format(invite_code, invite_code),
         parse_mode="Markdown"
     )
 
 
-@restricted
+# Main menu buttons that aren't conversation entry points, by label
+MENU_ROUTES = {
+    config.BUTTON_SHOW_LIST: show_list_handler,
+    config.BUTTON_TOGGLE_BOUGHT: toggle_view_handler,
+    config.BUTTON_SHARE_LIST: share_handler,
+}
+_MENU_FILTER = ALLOW_FILTER & filters.Text(list(MENU_ROUTES))
+
+
+async def menu_dispatch(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Route a main menu button press to its handler."""
+    return await MENU_ROUTES[update.message.text](update, context)
+
+
 async def join_command_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /join command."""
     if not context.args:
         await update.message.reply_text("Использование: /join КОД")
         return
     
-    invite_code = context.args[0].upper()
+    invite_code = context.args[0]
     context.user_data["pending_invite_code"] = invite_code
     
     keyboard = [
@@ -385,7 +742,8 @@ async def join_confirm_handler(update: Update, context: ContextTypes.DEFAULT_TYP
         await query.edit_message_text("Ошибка: код не найден.")
         return
 
-    success, message = db.join_group(update.effective_user.id, invite_code)
+    success, message = await run_db(db.join_group, update.effective_user.id, invite_code)
+    _invalidate_cache()
     if success:
         await query.edit_message_text(config.MSG_JOIN_SUCCESS)
     else:
@@ -394,7 +752,6 @@ async def join_confirm_handler(update: Update, context: ContextTypes.DEFAULT_TYP
     context.user_data.pop("pending_invite_code", None)
 
 
-@restricted
 async def add_category(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Command to add a new category."""
     
@@ -403,26 +760,20 @@ async def add_category(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     cat_name = " ".join(context.args).strip()
-    if db.add_category(update.effective_user.id, cat_name):
+    if await run_db(db.add_category, update.effective_user.id, cat_name):
+        _invalidate_cache()
         await update.message.reply_text(f"✅ Категория '{cat_name}' добавлена.")
     else:
         await update.message.reply_text("❌ Категория уже существует.")
 
 
-@restricted
+@restricted  # Also entered from an inline button, which ALLOW_FILTER can't gate
 async def manage_categories_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start category management flow."""
     if update.callback_query:
         await update.callback_query.answer()
     
-    keyboard = [
-        [InlineKeyboardButton("➕ Добавить категорию", callback_data="cat_add")],
-        [InlineKeyboardButton("✏️ Переименовать категорию", callback_data="cat_rename")],
-        [InlineKeyboardButton("🗑 Удалить категорию", callback_data="cat_delete")],
-        [InlineKeyboardButton("⬅️ Назад", callback_data="cancel")]
-    ]
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = CATEGORY_MENU_MARKUP
     if update.message:
         await update.message.reply_text(config.MSG_CATEGORY_MENU, reply_markup=reply_markup, parse_mode='Markdown')
     else:
@@ -443,21 +794,21 @@ async def cat_action_chosen(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return CAT_ADDING
     
     elif query.data == "cat_rename":
-        categories = db.get_categories(user_id)
+        categories = await _cached_categories(user_id)
         keyboard = []
         for cat in categories:
             keyboard.append([InlineKeyboardButton(cat, callback_data=f"rename_{cat}")])
-        keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="back_to_menu")])
+        keyboard.append([BTN_BACK_TO_MENU])
         
         await query.edit_message_text(config.MSG_CHOOSE_CATEGORY_TO_RENAME, reply_markup=InlineKeyboardMarkup(keyboard))
         return CAT_RENAMING_SELECT
     
     elif query.data == "cat_delete":
-        categories = db.get_categories(user_id)
+        categories = await _cached_categories(user_id)
         keyboard = []
         for cat in categories:
             keyboard.append([InlineKeyboardButton(cat, callback_data=f"delete_{cat}")])
-        keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="back_to_menu")])
+        keyboard.append([BTN_BACK_TO_MENU])
         
         await query.edit_message_text(config.MSG_CHOOSE_CATEGORY_TO_DELETE, reply_markup=InlineKeyboardMarkup(keyboard))
         return CAT_DELETING_SELECT
@@ -475,7 +826,8 @@ async def cat_adding_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     cat_name = update.message.text.strip()
     user_id = update.effective_user.id
     
-    if db.add_category(user_id, cat_name):
+    if await run_db(db.add_category, user_id, cat_name):
+        _invalidate_cache()
         await update.message.reply_text(f"✅ Категория '{cat_name}' добавлена.")
     else:
         await update.message.reply_text(config.MSG_CATEGORY_EXISTS)
@@ -504,7 +856,8 @@ async def cat_renaming_new_name(update: Update, context: ContextTypes.DEFAULT_TY
     old_name = context.user_data.get("old_cat_name")
     user_id = update.effective_user.id
     
-    if db.rename_category(user_id, old_name, new_name):
+    if await run_db(db.rename_category, user_id, old_name, new_name):
+        _invalidate_cache()
         await update.message.reply_text(config.MSG_CATEGORY_RENAMED)
     else:
         await update.message.reply_text(config.MSG_CATEGORY_EXISTS)
@@ -524,8 +877,7 @@ async def cat_deleting_selected(update: Update, context: ContextTypes.DEFAULT_TY
     user_id = update.effective_user.id
     
     # Check how many items are in this category
-    items = db.get_items(user_id, include_bought=True)
-    cat_items_count = len([i for i in items if i['department'] == cat_name])
+    cat_items_count = await run_db(db.count_items, user_id, cat_name)
     
     context.user_data["delete_cat_name"] = cat_name
     
@@ -553,7 +905,8 @@ async def cat_deleting_confirmed(update: Update, context: ContextTypes.DEFAULT_T
     cat_name = context.user_data.get("delete_cat_name")
     user_id = update.effective_user.id
     
-    success, items_deleted = db.delete_category(user_id, cat_name)
+    success, items_deleted = await run_db(db.delete_category, user_id, cat_name)
+    _invalidate_cache()
     if success:
         await query.edit_message_text(config.MSG_CATEGORY_DELETED.format(items_deleted))
     else:
@@ -563,13 +916,122 @@ async def cat_deleting_confirmed(update: Update, context: ContextTypes.DEFAULT_T
 
 
 async def test_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Simple test handler that skips check_access."""
+    """Simple test handler to check the bot is receiving messages."""
     await update.message.reply_text("Бот работает и видит ваши сообщения! ✅")
 
-@restricted
-async def test_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Simple test handler that skips check_access."""
-    await update.message.reply_text("Бот работает и видит ваши сообщения! ✅")
+
+# Recently handled callback query ids, oldest first
+RECENT_QUERIES_MAX = 4096
+_recent_queries = OrderedDict()
+# Repeated taps on the same navigation button within this window (seconds) are
+# ignored. Toggles (items, edit mode, bought view) and deletes always go through,
+# so a quick second tap can undo the first.
+PRESS_DEBOUNCE = 0.5
+_last_press = {}
+
+
+def _is_navigation(data: str) -> bool:
+    """Check whether callback data only opens a view, so repeating it changes nothing."""
+    return data in ("a", "list_cats") or (data[:1] in ("l", "p") and data[1:].isdigit())
+
+
+def _is_duplicate_press(query, user_id: int) -> bool:
+    """Check whether a callback is a replay or a rapid repeat of the last navigation tap."""
+    now = time.monotonic()
+    if query.id in _recent_queries:
+        return True
+    _recent_queries[query.id] = now
+    if len(_recent_queries) > RECENT_QUERIES_MAX:
+        _recent_queries.popitem(last=False)
+
+    last = _last_press.get(user_id)
+    _last_press[user_id] = (query.data, now)
+    return (last is not None and last[0] == query.data and now - last[1] < PRESS_DEBOUNCE
+            and _is_navigation(query.data))
+
+
+async def _route_list_cats(update: Update, context: ContextTypes.DEFAULT_TYPE, arg=None):
+    """Back to the category menu, leaving edit mode."""
+    context.user_data["edit_mode"] = False
+    await list_items(update, context)
+
+
+async def _route_toggle_view(update: Update, context: ContextTypes.DEFAULT_TYPE, arg=None):
+    """Show or hide bought items in the current view."""
+    context.user_data["show_bought"] = not context.user_data.get("show_bought", False)
+    await list_items(update, context)
+
+
+async def _route_all(update: Update, context: ContextTypes.DEFAULT_TYPE, arg=None):
+    """Open the view with every item."""
+    await list_items(update, context, category="ALL")
+
+
+async def _route_edit_mode(update: Update, context: ContextTypes.DEFAULT_TYPE, arg=None):
+    """Switch delete mode on the current view and page."""
+    context.user_data["edit_mode"] = not context.user_data.get("edit_mode", False)
+    await list_items(update, context, category=context.user_data.get("last_category"),
+                     page=context.user_data.get("last_page", 0))
+
+
+async def _route_join_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE, arg=None):
+    """Join the group from the pending /join code."""
+    await join_confirm_handler(update, context)
+
+
+async def _route_join_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE, arg=None):
+    """Drop the pending /join code."""
+    context.user_data.pop("pending_invite_code", None)
+    await update.callback_query.edit_message_text("Вход в группу отменен.")
+
+
+async def _route_category(update: Update, context: ContextTypes.DEFAULT_TYPE, index: int):
+    """Open a category by its index in the menu snapshot."""
+    cats = context.user_data.get("cats") or []
+    await list_items(update, context, category=cats[index] if index < len(cats) else None)
+
+
+async def _route_page(update: Update, context: ContextTypes.DEFAULT_TYPE, page: int):
+    """Go to a page of the current view."""
+    await list_items(update, context, category=context.user_data.get("last_category"), page=page)
+
+
+async def _route_toggle(update: Update, context: ContextTypes.DEFAULT_TYPE, item_id: int):
+    """Toggle an item's bought flag."""
+    bought = await _submit_write("toggle", item_id, update.effective_user.id)
+    _invalidate_cache(items_only=True)
+    # Bought items stay visible when shown, so only the tapped button changes
+    if context.user_data.get("show_bought") and await _patch_item_button(update, context, bought):
+        return
+    # Update current view once the burst of taps settles
+    _schedule_render(update, context, context.user_data.get("last_category"))
+
+
+async def _route_delete(update: Update, context: ContextTypes.DEFAULT_TYPE, item_id: int):
+    """Delete an item."""
+    await _submit_write("delete", item_id, update.effective_user.id)
+    _invalidate_cache(items_only=True)
+    # Update current view once the burst of taps settles
+    _schedule_render(update, context, context.user_data.get("last_category"))
+
+
+# Callback routes: whole callback_data first, then compact opcodes with a
+# numeric argument (t<id> toggle, d<id> delete, l<idx> category, p<n> page).
+# Categories and pages refer to the current view.
+EXACT_ROUTES = {
+    "list_cats": _route_list_cats,
+    "toggle_view_inline": _route_toggle_view,
+    "a": _route_all,
+    "e": _route_edit_mode,
+    "join_confirm": _route_join_confirm,
+    "join_cancel": _route_join_cancel,
+}
+OP_ROUTES = {
+    "l": _route_category,
+    "p": _route_page,
+    "t": _route_toggle,
+    "d": _route_delete,
+}
 
 
 async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -579,70 +1041,127 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     user_id = update.effective_user.id
     data = query.data
+    if user_id not in _ALLOWED or _is_duplicate_press(query, user_id):
+        return
+    
+    route = EXACT_ROUTES.get(data)
+    if route:
+        await route(update, context)
+        return
+    op, arg = data[:1], data[1:]
+    route = OP_ROUTES.get(op)
+    if route and arg.isdigit():
+        await route(update, context, int(arg))
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Process updates concurrently across chats but one at a time within a chat.
+    
+    Conversation state and the per-chat user_data keys used by list rendering
+    are read and then written by handlers, so updates from the same chat must
+    not interleave.
     
-    if data == "list_cats":
-        context.user_data["edit_mode"] = False
-        await list_items(update, context)
-    elif data.startswith("list_"):
-        cat = data[5:] # More robust
-        await list_items(update, context, category=cat)
-    elif data == "toggle_view_inline":
-        current = context.user_data.get("show_bought", False)
-        context.user_data["show_bought"] = not current
-        await list_items(update, context)
-    elif data.startswith("toggle_edit_"):
-        cat = data.replace("toggle_edit_", "")
-        current = context.user_data.get("edit_mode", False)
-        context.user_data["edit_mode"] = not current
-        await list_items(update, context, category=cat)
-    elif data.startswith("tog_"):
-        parts = data.split("_")
-        item_id = int(parts[1])
-        ref_cat = parts[2] if len(parts) > 2 else None
-        db.toggle_bought(item_id, user_id)
-        # Update current view
-        await list_items(update, context, category=ref_cat if ref_cat != "all" else "ALL")
-    elif data.startswith("del_"):
-        parts = data.split("_")
-        item_id = int(parts[1])
-        ref_cat = parts[2] if len(parts) > 2 else None
-        db.delete_item(item_id, user_id)
-        # Update current view
-        await list_items(update, context, category=ref_cat if ref_cat != "all" else "ALL")
-    elif data == "join_confirm":
-        await join_confirm_handler(update, context)
-    elif data == "join_cancel":
-        context.user_data.pop("pending_invite_code", None)
-        await query.edit_message_text("Вход в группу отменен.")
+    The concurrency cap is enforced here, after the chat lock, rather than by
+    the base class: updates queued behind their chat's lock must not hold a
+    slot, or one busy chat could starve all the others.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        # Effectively uncapped in the base class; see above
+        super().__init__(2 ** 31 - 1)
+        self._slots = asyncio.Semaphore(max_concurrent_updates)
+        # chat_id -> lock; entries go away once no update holds or awaits them
+        self._chat_locks = weakref.WeakValueDictionary()
+
+    def chat_lock(self, chat_id: int) -> asyncio.Lock:
+        """Get the lock serializing work for one chat."""
+        lock = self._chat_locks.get(chat_id)
+        if lock is None:
+            lock = self._chat_locks[chat_id] = asyncio.Lock()
+        return lock
+
+    async def do_process_update(self, update, coroutine):
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None:
+            async with self._slots:
+                await coroutine
+            return
+        async with self.chat_lock(chat.id):
+            async with self._slots:
+                await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
 
 
 def main():
     """Run bot."""
-    logger.info(f"DEBUG: BOT_TOKEN is set: {bool(config.BOT_TOKEN)}")
-    logger.info(f"DEBUG: ALLOWED_USERS: {config.ALLOWED_USERS}")
+    logger.info("DEBUG: BOT_TOKEN is set: %s", bool(config.BOT_TOKEN))
+    logger.info("DEBUG: ALLOWED_USERS: %s", config.ALLOWED_USERS)
     if not config.BOT_TOKEN:
         print("Error: BOT_TOKEN not found in .env")
         return
 
-    application = Application.builder().token(config.BOT_TOKEN).build()
+    # Faster event loop where available (not on Windows)
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+
+    # Keep user_data (view state, seeding flag) across restarts
+    persistence_dir = os.path.dirname(config.PERSISTENCE_PATH)
+    if persistence_dir:
+        os.makedirs(persistence_dir, exist_ok=True)
+
+    builder = (
+        Application.builder()
+        .token(config.BOT_TOKEN)
+        .persistence(PicklePersistence(filepath=config.PERSISTENCE_PATH))
+        # Explicit pool sizing so bursts of concurrent API calls don't exhaust it
+        .connection_pool_size(256)
+        .pool_timeout(30)
+        .connect_timeout(10)
+        .read_timeout(30)
+        .write_timeout(20)
+        # Multiplex outgoing edits/sends over a few HTTP/2 connections
+        .http_version("2")
+        .get_updates_connection_pool_size(64)
+        .get_updates_pool_timeout(30)
+        .get_updates_read_timeout(40)
+        # Handle updates from different chats in parallel; same-chat updates
+        # stay in order
+        .concurrent_updates(PerChatUpdateProcessor(256))
+        # Shape outgoing calls under Telegram's ~30 msg/s limit, retrying on 429
+        .rate_limiter(AIORateLimiter(overall_max_rate=28, overall_time_period=1, max_retries=3))
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if config.BOT_API_BASE_URL:
+        # Self-hosted Bot API server, e.g. "http://localhost:8081/bot"
+        builder = builder.base_url(config.BOT_API_BASE_URL)
+    application = builder.build()
     
     # Common navigation fallbacks to break out of any conversation
     nav_fallbacks = [
-        MessageHandler(filters.Regex(f"^{config.BUTTON_SHOW_LIST}$"), show_list_handler),
-        MessageHandler(filters.Regex(f"^{config.BUTTON_TOGGLE_BOUGHT}$"), toggle_view_handler),
-        MessageHandler(filters.Regex(f"^{config.BUTTON_MANAGE_CATS}$"), manage_categories_start),
-        CommandHandler("start", start),
-        CommandHandler("share", share_handler),
-        CommandHandler("join", join_command_handler),
+        MessageHandler(_MENU_FILTER, menu_dispatch),
+        MessageHandler(_MANAGE_CATS_FILTER, manage_categories_start),
+        CommandHandler("start", start, filters=ALLOW_FILTER),
+        CommandHandler("share", share_handler, filters=ALLOW_FILTER),
+        CommandHandler("join", join_command_handler, filters=ALLOW_FILTER),
         CommandHandler("cancel", cancel),
         CallbackQueryHandler(cancel, pattern="^cancel$")
     ]
 
     # Add Item logic
     conv_handler = ConversationHandler(
-        entry_points=[MessageHandler(filters.Regex(f"^{config.BUTTON_ADD_ITEM}$"), add_item_start)],
+        entry_points=[MessageHandler(_ADD_ITEM_FILTER, add_item_start)],
         states={
-            CHOOSING_DEPARTMENT: [CallbackQueryHandler(department_chosen)],
+            # Only the add flow's own buttons; list taps fall through to callback_handler
+            CHOOSING_DEPARTMENT: [CallbackQueryHandler(department_chosen, pattern=r"^(dept\||dept_\d+$|cancel$)")],
             ENTERING_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, item_name_entered)],
         },
         fallbacks=nav_fallbacks,
@@ -651,8 +1170,8 @@ def main():
     
     cat_conv_handler = ConversationHandler(
         entry_points=[
-            CommandHandler("manage_categories", manage_categories_start),
-            MessageHandler(filters.Text([config.BUTTON_MANAGE_CATS]), manage_categories_start),
+            CommandHandler("manage_categories", manage_categories_start, filters=ALLOW_FILTER),
+            MessageHandler(_MANAGE_CATS_FILTER, manage_categories_start),
             CallbackQueryHandler(manage_categories_start, pattern="^manage_cats_inline$")
         ],
         states={
@@ -667,21 +1186,38 @@ def main():
         allow_reentry=True
     )
     
-    application.add_handler(MessageHandler(filters.ALL, global_trace), group=-1) # Group -1 ensures it runs first
-    application.add_handler(CommandHandler("test", test_handler))
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("add_cat", add_category))
+    if logger.isEnabledFor(logging.DEBUG):
+        # Tracing only; a late group keeps it off the main handlers' path
+        application.add_handler(MessageHandler(filters.ALL, global_trace), group=100)
+    application.add_handler(CommandHandler("test", test_handler, filters=ALLOW_FILTER))
+    application.add_handler(CommandHandler("start", start, filters=ALLOW_FILTER))
+    application.add_handler(CommandHandler("add_cat", add_category, filters=ALLOW_FILTER))
     application.add_handler(conv_handler)
     application.add_handler(cat_conv_handler)
-    application.add_handler(MessageHandler(filters.Text([config.BUTTON_SHOW_LIST]), show_list_handler))
-    application.add_handler(MessageHandler(filters.Text([config.BUTTON_TOGGLE_BOUGHT]), toggle_view_handler))
-    application.add_handler(CommandHandler("join", join_command_handler))
-    application.add_handler(CommandHandler("share", share_handler))
-    application.add_handler(MessageHandler(filters.Text([config.BUTTON_SHARE_LIST]), share_handler))
+    application.add_handler(MessageHandler(_MENU_FILTER, menu_dispatch))
+    application.add_handler(CommandHandler("join", join_command_handler, filters=ALLOW_FILTER))
+    application.add_handler(CommandHandler("share", share_handler, filters=ALLOW_FILTER))
     application.add_handler(CallbackQueryHandler(callback_handler))
+    # Only answer strangers in private chats, and only on commands and menu
+    # buttons; anything else from them (e.g. group spam) is dropped silently
+    application.add_handler(MessageHandler(
+        filters.ChatType.PRIVATE & filters.USER & ~ALLOW_FILTER
+        & (filters.COMMAND | filters.Text([*MENU_ROUTES, config.BUTTON_ADD_ITEM, config.BUTTON_MANAGE_CATS])),
+        access_denied
+    ))
     
     logger.info("Bot started...")
-    application.run_polling()
+    if config.WEBHOOK_URL:
+        # Telegram pushes updates to us; no getUpdates round-trip per batch
+        application.run_webhook(
+            listen="0.0.0.0",
+            port=config.WEBHOOK_PORT,
+            url_path=config.BOT_TOKEN,
+            webhook_url=f"{config.WEBHOOK_URL.rstrip('/')}/{config.BOT_TOKEN}",
+            secret_token=config.WEBHOOK_SECRET or None
+        )
+    else:
+        application.run_polling()
 
 
 if __name__ == "__main__":
@@ -4,11 +4,34 @@ from typing import List
 
 # Bot configuration
 BOT_TOKEN = os.getenv("BOT_TOKEN", "")
-# Parse allowed users from string "id1,id2,id3"
-ALLOWED_USERS = [int(user_id.strip()) for user_id in os.getenv("ALLOWED_USERS", "").split(",") if user_id.strip()]
+# Parse allowed users from string "id1,id2,id3"; a frozenset for O(1) access checks
+ALLOWED_USERS = frozenset(int(user_id.strip()) for user_id in os.getenv("ALLOWED_USERS", "").split(",") if user_id.strip())
+
+# Logging level name, e.g. "DEBUG" to trace every update
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+# Optional self-hosted Bot API server; empty means api.telegram.org
+BOT_API_BASE_URL = os.getenv("BOT_API_BASE_URL", "")
+
+# Webhook mode: set WEBHOOK_URL (public https base URL) to receive updates
+# via webhook instead of long polling
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PORT = int(os.getenv("PORT", "8443"))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
 
 # Database configuration
 DATABASE_URL = os.getenv("DATABASE_URL", "data/shopping_list.db")
+# Run once on the shared connection. Under WAL (always on), synchronous=NORMAL
+# skips the fsync per commit; temp tables and sorts stay in memory.
+SQLITE_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA mmap_size=268435456",
+)
+
+# Bot state persistence (user_data survives restarts)
+PERSISTENCE_PATH = os.getenv("PERSISTENCE_PATH", "data/bot_state.pkl")
 
 # Button labels
 BUTTON_ADD_ITEM = "➕ Добавить"
@@ -1,19 +1,157 @@
 """Database module for managing shopping list items using SQLite."""
 import sqlite3
 import os
-import uuid
-from typing import List, Dict, Optional, Tuple
+import secrets
+import threading
+from collections import namedtuple
+from typing import Dict, List, Optional, Tuple
 from contextlib import contextmanager
 
 
+# Minimal tuning for callers that don't pass their own PRAGMAs; the bot passes
+# config.SQLITE_PRAGMAS, which is the full set (kept there so this module stays
+# free of bot configuration)
+DEFAULT_PRAGMAS = ("PRAGMA synchronous=NORMAL",)
+
+# Default categories and items for a new group, built once at import
+_INITIAL_CATEGORIES = (
+    "🧹 Быт и уборка",
+    "🧴 Гигиена и уход",
+    "🍳 Дом и кухня",
+    "🥦 Овощи и зелень",
+    "🍎 Фрукты и ягоды",
+    "🥩 Мясо, рыба и птица",
+    "🥛 Молочные продукты и яйца",
+    "🍝 Бакалея",
+    "🥫 Консервы и готовые продукты",
+    "🍬 Сладости и снеки",
+    "🍷 Напитки и алкоголь",
+    "🍼 Детские товары"
+)
+
+_SEED_ITEMS = (
+    # Быт и уборка
+    ("Пакеты для мусора", "🧹 Быт и уборка"), ("Жидкость для посудомойки", "🧹 Быт и уборка"),
+    ("Таблетки для посудомойки", "🧹 Быт и уборка"), ("Хлорка", "🧹 Быт и уборка"),
+    ("Максима для стирки", "🧹 Быт и уборка"), ("Батарейки", "🧹 Быт и уборка"),
+
+    # Гигиена и уход
+    ("Мыло для рук", "🧴 Гигиена и уход"), ("Зубная паста", "🧴 Гигиена и уход"),
+    ("Влажные салфетки", "🧴 Гигиена и уход"), ("Ёршики для унитаза", "🧴 Гигиена и уход"),
+    ("Репеллент", "🧴 Гигиена и уход"), ("Прокладки", "🧴 Гигиена и уход"),
+    ("Шампунь", "🧴 Гигиена и уход"), ("Зубные щётки", "🧴 Гигиена и уход"),
+    ("Дезодорант", "🧴 Гигиена и уход"), ("Жидкое мыло", "🧴 Гигиена и уход"),
+    ("Туалетная бумага", "🧴 Гигиена и уход"), ("Бумажные полотенца", "🧴 Гигиена и уход"),
+    ("Детская нить для зубов", "🧴 Гигиена и уход"),
+
+    # Дом и кухня
+    ("Прихватки", "🍳 Дом и кухня"), ("Сидушка для унитаза", "🍳 Дом и кухня"),
+    ("Контейнеры для хранения", "🍳 Дом и кухня"), ("Фольга", "🍳 Дом и кухня"),
+    ("Дуршлаг", "🍳 Дом и кухня"), ("Силикон формы для запекания", "🍳 Дом и кухня"),
+    ("Бутылка для воды", "🍳 Дом и кухня"),
+
+    # Овощи и зелень
+    ("Помидоры", "🥦 Овощи и зелень"), ("Картошка", "🥦 Овощи и зелень"),
+    ("Болгарский перец", "🥦 Овощи и зелень"), ("Огурцы свежие", "🥦 Овощи и зелень"),
+    ("Морковь", "🥦 Овощи и зелень"), ("Лук", "🥦 Овощи и зелень"),
+    ("Кукуруза", "🥦 Овощи и зелень"), ("Батат", "🥦 Овощи и зелень"),
+    ("Чеснок", "🥦 Овощи и зелень"), ("Баклажан", "🥦 Овощи и зелень"),
+    ("Свекла", "🥦 Овощи и зелень"), ("Брокколи", "🥦 Овощи и зелень"),
+    ("Руккола", "🥦 Овощи и зелень"), ("Авокадо", "🥦 Овощи и зелень"),
+    ("Кабачки", "🥦 Овощи и зелень"), ("Тыква", "🥦 Овощи и зелень"),
+    ("Капуста", "🥦 Овощи и зелень"), ("Шампиньоны", "🥦 Овощи и зелень"),
+
+    # Фрукты и ягоды
+    ("Бананы", "🍎 Фрукты и ягоды"), ("Яблоки", "🍎 Фрукты и ягоды"),
+    ("Арбуз", "🍎 Фрукты и ягоды"), ("Груша", "🍎 Фрукты и ягоды"),
+    ("Нектарины", "🍎 Фрукты и ягоды"), ("Дыня", "🍎 Фрукты и ягоды"),
+    ("Виноград", "🍎 Фрукты и ягоды"), ("Чернослив", "🍎 Фрукты и ягоды"),
+    ("Ягоды / заморозка", "🍎 Фрукты и ягоды"), ("Хурма", "🍎 Фрукты и ягоды"),
+    ("Апельсин", "🍎 Фрукты и ягоды"),
+
+    # Напитки и алкоголь
+    ("Вода", "🍷 Напитки и алкоголь"), ("Вино", "🍷 Напитки и алкоголь"),
+    ("Сок", "🍷 Напитки и алкоголь"), ("Лёд", "🍷 Напитки и алкоголь"),
+    ("Пиво", "🍷 Напитки и алкоголь"), ("Коньяк", "🍷 Напитки и алкоголь"),
+    ("Кофе", "🍷 Напитки и алкоголь"), ("Чай", "🍷 Напитки и алкоголь"),
+    ("Какао", "🍷 Напитки и алкоголь"),
+
+    # Детские товары
+    ("Пюре", "🍼 Детские товары"), ("Памперсы", "🍼 Детские товары"),
+    ("Памперсы трусики", "🍼 Детские товары"),
+
+    # Сладости и снеки
+    ("Бамба", "🍬 Сладости и снеки"), ("Маршмэллоу", "🍬 Сладости и снеки"),
+    ("Сахар", "🍬 Сладости и снеки"), ("Темный шоколад", "🍬 Сладости и снеки"),
+    ("Курага", "🍬 Сладости и снеки"), ("Тыквенные семечки", "🍬 Сладости и снеки"),
+    ("К чаю", "🍬 Сладости и снеки"), ("Ванильный сахар", "🍬 Сладости и снеки"),
+
+    # Бакалея
+    ("Паста", "🍝 Бакалея"), ("Гречка", "🍝 Бакалея"), ("Манка", "🍝 Бакалея"),
+    ("Соль", "🍝 Бакалея"), ("Мука", "🍝 Бакалея"), ("Овсянка", "🍝 Бакалея"),
+    ("Лимонный сок", "🍝 Бакалея"), ("Оливковое масло", "🍝 Бакалея"),
+    ("Рис", "🍝 Бакалея"), ("Киноа", "🍝 Бакалея"), ("Булгур", "🍝 Бакалея"),
+    ("Бурый рис", "🍝 Бакалея"), ("Пшено", "🍝 Бакалея"), ("Хумус", "🍝 Бакалея"),
+    ("Паста для пиццы", "🍝 Бакалея"), ("Чечевица", "🍝 Бакалея"), ("Хлеб", "🍝 Бакалея"),
+
+    # Консервы и готовые продукты
+    ("Соленые огурцы", "🥫 Консервы и готовые продукты"),
+    ("Консервированная кукуруза", "🥫 Консервы и готовые продукты"),
+    ("Мак (сушеный)", "🥫 Консервы и готовые продукты"),
+    ("Консерв белая фасоль", "🥫 Консервы и готовые продукты"),
+    ("Корица молотая", "🥫 Консервы и готовые продукты"),
+    ("Сардины в банке", "🥫 Консервы и готовые продукты"),
+    ("Оливки", "🥫 Консервы и готовые продукты"),
+
+    # Молочные продукты и яйца
+    ("Яйца", "🥛 Молочные продукты и яйца"), ("Молоко", "🥛 Молочные продукты и яйца"),
+    ("Сливочное масло", "🥛 Молочные продукты и яйца"), ("Йогурт", "🥛 Молочные продукты и яйца"),
+    ("Сыр", "🥛 Молочные продукты и яйца"), ("Сыр фета", "🥛 Молочные продукты и яйца"),
+    ("Творог", "🥛 Молочные продукты и яйца"), ("Кефир", "🥛 Молочные продукты и яйца"),
+    ("Моцарелла", "🥛 Молочные продукты и яйца"), ("Сливки", "🥛 Молочные продукты и яйца"),
+
+    # Мясо, рыба и птица
+    ("Мясо", "🥩 Мясо, рыба и птица"), ("Курица", "🥩 Мясо, рыба и птица"),
+    ("Рыба", "🥩 Мясо, рыба и птица"), ("Ветчина", "🥩 Мясо, рыба и птица"),
+    ("Колбаса", "🥩 Мясо, рыба и птица"), ("Печень", "🥩 Мясо, рыба и птица"),
+    ("Индейка", "🥩 Мясо, рыба и птица"), ("Фарш говяжий", "🥩 Мясо, рыба и птица"),
+    ("Сосиски", "🥩 Мясо, рыба и птица")
+)
+
+# Seed inserts as single multi-row statements (4 params per item, well under
+# SQLite's bound-parameter limit)
+_SEED_CATEGORIES_SQL = (
+    "INSERT OR IGNORE INTO categories (user_id, group_id, name) VALUES "
+    + ", ".join(["(?, ?, ?)"] * len(_INITIAL_CATEGORIES))
+)
+_SEED_ITEMS_SQL = (
+    "INSERT INTO items (user_id, group_id, name, department, is_bought) VALUES "
+    + ", ".join(["(?, ?, ?, ?, 0)"] * len(_SEED_ITEMS))
+)
+
+# Lightweight item row returned by the list queries
+Item = namedtuple("Item", "id name department is_bought")
+
+
+def _item_factory(cursor, row) -> Item:
+    """Row factory building Item tuples straight from SQLite rows."""
+    return Item(*row)
+
+
+def _new_invite_code() -> str:
+    """Random 8-character uppercase hex invite code."""
+    return secrets.token_hex(4).upper()
+
+
 class Database:
     """Lightweight SQLite database for shopping list management."""
     
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, pragmas=DEFAULT_PRAGMAS):
         """Initialize database connection.
         
         Args:
             db_path: Path to SQLite database file
+            pragmas: PRAGMA statements run once on the shared connection
         """
         # Ensure data directory exists
         db_dir = os.path.dirname(db_path)
@@ -21,25 +159,52 @@ class Database:
             os.makedirs(db_dir, exist_ok=True)
             
         self.db_path = db_path
+        # One long-lived connection, shared by the bot's worker threads. Calls
+        # are serialized by the lock; transactions are managed explicitly.
+        # Its statement cache (keyed by SQL text) keeps every query prepared.
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None,
+                                     cached_statements=256)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        # user_id -> group_id; only written under the lock, so join_group's
+        # update can't be overtaken by a stale lookup
+        self._group_cache = {}
+        # Lets clear_bought_items hand free pages back; only takes effect on a new
+        # file and must come before the WAL switch
+        self._conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        # WAL keeps readers in other processes off the writer's back; persists in the file
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        for pragma in pragmas:
+            self._conn.execute(pragma)
         self._init_db()
     
     @contextmanager
-    def _get_connection(self):
-        """Context manager for database connections."""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        try:
-            yield conn
-            conn.commit()
-        except Exception:
-            conn.rollback()
-            raise
-        finally:
-            conn.close()
+    def _get_connection(self, immediate: bool = False):
+        """Run a block in one transaction on the shared connection.
+        
+        Args:
+            immediate: Take the write lock up front (BEGIN IMMEDIATE)
+        """
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+    
+    def close(self):
+        """Close the shared connection."""
+        with self._lock:
+            # Refresh planner statistics for tables whose shape has changed
+            self._conn.execute("PRAGMA optimize")
+            self._conn.close()
     
     def _init_db(self):
         """Initialize database schema and seed initial data."""
-        with self._get_connection() as conn:
+        with self._get_connection(immediate=True) as conn:
             # Groups table
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS groups (
@@ -78,16 +243,33 @@ class Database:
                     department TEXT NOT NULL,
                     is_bought INTEGER DEFAULT 0,
                     group_id INTEGER,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    created_at INTEGER DEFAULT (unixepoch())
                 )
             """)
             
             # Migrations
             self._migrate(conn)
 
+            # Trailing NOCASE name lets the list queries walk the index in
+            # display order instead of sorting
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_items_group_dept_name
+                ON items(group_id, department, is_bought, name COLLATE NOCASE)
+            """)
             conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_group_id ON items(group_id)
+                CREATE INDEX IF NOT EXISTS idx_items_group_bought_name
+                ON items(group_id, is_bought, name COLLATE NOCASE)
             """)
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_categories_group ON categories(group_id, id)
+            """)
+            conn.execute("""
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_groups_invite_nocase ON groups(invite_code COLLATE NOCASE)
+            """)
+            # Covered by the composite indexes above
+            conn.execute("DROP INDEX IF EXISTS idx_group_id")
+            conn.execute("DROP INDEX IF EXISTS idx_items_group_dept")
+            conn.execute("DROP INDEX IF EXISTS idx_items_group_bought")
 
     def _migrate(self, conn):
         """Migrate legacy data to group-based system."""
@@ -106,53 +288,64 @@ class Database:
             conn.execute("ALTER TABLE items ADD COLUMN group_id INTEGER")
 
         # 3. Create groups for existing users who don't have one
-        # Find all unique user_ids from all tables
+        # (only legacy users are left without a mapping, so this is usually empty)
         cursor = conn.execute("""
-            SELECT user_id FROM items 
-            UNION SELECT user_id FROM categories 
-            UNION SELECT user_id FROM user_groups
+            SELECT user_id FROM items
+            UNION SELECT user_id FROM categories
+            EXCEPT SELECT user_id FROM user_groups
         """)
-        user_ids = [row["user_id"] for row in cursor.fetchall()]
+        for row in cursor.fetchall():
+            group_id = conn.execute(
+                "INSERT INTO groups (invite_code) VALUES (?) RETURNING id", (_new_invite_code(),)
+            ).fetchone()["id"]
+            conn.execute("INSERT INTO user_groups (user_id, group_id) VALUES (?, ?)", (row["user_id"], group_id))
         
-        for user_id in user_ids:
-            # Check if user has a group
-            cursor = conn.execute("SELECT group_id FROM user_groups WHERE user_id = ?", (user_id,))
-            row = cursor.fetchone()
-            if not row:
-                # Create a group for this user
-                import uuid
-                invite_code = str(uuid.uuid4())[:8].upper()
-                cursor = conn.execute("INSERT INTO groups (invite_code) VALUES (?)", (invite_code,))
-                group_id = cursor.lastrowid
-                conn.execute("INSERT INTO user_groups (user_id, group_id) VALUES (?, ?)", (user_id, group_id))
-            else:
-                group_id = row["group_id"]
-            
-            # Update their items and categories
-            conn.execute("UPDATE items SET group_id = ? WHERE user_id = ? AND group_id IS NULL", (group_id, user_id))
-            conn.execute("UPDATE categories SET group_id = ? WHERE user_id = ? AND group_id IS NULL", (group_id, user_id))
-            
-    def _get_user_group(self, user_id: int) -> int:
-        """Get the group_id for a user, creating a personal group if none exists."""
-        with self._get_connection() as conn:
-            cursor = conn.execute("SELECT group_id FROM user_groups WHERE user_id = ?", (user_id,))
-            row = cursor.fetchone()
-            if row:
-                return row["group_id"]
+        # 4. Attach ungrouped items and categories to their owner's group, all users at once
+        conn.execute("""
+            UPDATE items SET group_id = (SELECT group_id FROM user_groups ug WHERE ug.user_id = items.user_id)
+            WHERE group_id IS NULL
+        """)
+        conn.execute("""
+            UPDATE categories SET group_id = (SELECT group_id FROM user_groups ug WHERE ug.user_id = categories.user_id)
+            WHERE group_id IS NULL
+        """)
             
-            # Create a personal group if none exists
-            invite_code = str(uuid.uuid4())[:8].upper()
-            cursor = conn.execute("INSERT INTO groups (invite_code) VALUES (?)", (invite_code,))
-            group_id = cursor.lastrowid
-            conn.execute("INSERT INTO user_groups (user_id, group_id) VALUES (?, ?)", (user_id, group_id))
+    def _read_connection(self, user_id: int):
+        """Transaction for a read-only method.
+        
+        IMMEDIATE on a group-cache miss, since resolving the group may create it.
+        """
+        return self._get_connection(immediate=user_id not in self._group_cache)
+
+    def _get_user_group(self, user_id: int, conn) -> int:
+        """Get the group_id for a user, creating a personal group if none exists.
+        
+        Args:
+            user_id: Telegram user ID
+            conn: Open connection to resolve on, so callers need no extra transaction
+        """
+        group_id = self._group_cache.get(user_id)
+        if group_id is not None:
             return group_id
+        
+        row = conn.execute("SELECT group_id FROM user_groups WHERE user_id = ?", (user_id,)).fetchone()
+        if row:
+            self._group_cache[user_id] = row["group_id"]
+            return row["group_id"]
+        
+        # Create a personal group if none exists. Not cached yet: the caller's
+        # transaction may still roll it back; the next lookup will cache it.
+        invite_code = _new_invite_code()
+        cursor = conn.execute("INSERT INTO groups (invite_code) VALUES (?)", (invite_code,))
+        group_id = cursor.lastrowid
+        conn.execute("INSERT INTO user_groups (user_id, group_id) VALUES (?, ?)", (user_id, group_id))
+        return group_id
 
     def get_invite_code(self, user_id: int) -> str:
         """Get the invite code for the user's current group."""
-        group_id = self._get_user_group(user_id)
-        with self._get_connection() as conn:
-            cursor = conn.execute("SELECT invite_code FROM groups WHERE id = ?", (group_id,))
-            row = cursor.fetchone()
+        with self._read_connection(user_id) as conn:
+            group_id = self._get_user_group(user_id, conn)
+            row = conn.execute("SELECT invite_code FROM groups WHERE id = ?", (group_id,)).fetchone()
             return row["invite_code"] if row else ""
 
     def join_group(self, user_id: int, invite_code: str) -> Tuple[bool, str]:
@@ -161,18 +354,19 @@ class Database:
         Returns:
             Tuple of (success, message)
         """
-        invite_code = invite_code.strip().upper()
-        with self._get_connection() as conn:
-            cursor = conn.execute("SELECT id FROM groups WHERE invite_code = ?", (invite_code,))
-            row = cursor.fetchone()
+        invite_code = invite_code.strip()
+        with self._get_connection(immediate=True) as conn:
+            # Case-insensitive match, served by idx_groups_invite_nocase
+            row = conn.execute(
+                "SELECT id FROM groups WHERE invite_code = ? COLLATE NOCASE", (invite_code,)
+            ).fetchone()
             if not row:
                 return False, "Неверный код приглашения."
             
             new_group_id = row["id"]
             
             # Check if user is already in this group
-            cursor = conn.execute("SELECT group_id FROM user_groups WHERE user_id = ?", (user_id,))
-            current_row = cursor.fetchone()
+            current_row = conn.execute("SELECT group_id FROM user_groups WHERE user_id = ?", (user_id,)).fetchone()
             if current_row and current_row["group_id"] == new_group_id:
                 return True, "Вы уже в этой группе."
 
@@ -181,172 +375,66 @@ class Database:
                 conn.execute("UPDATE user_groups SET group_id = ? WHERE user_id = ?", (new_group_id, user_id))
             else:
                 conn.execute("INSERT INTO user_groups (user_id, group_id) VALUES (?, ?)", (user_id, new_group_id))
+            self._group_cache[user_id] = new_group_id
             
             return True, "Вы успешно присоединились к группе!"
 
     def seed_data(self, user_id: int):
         """Seed initial categories and items for the user's group."""
-        group_id = self._get_user_group(user_id)
-        
-        initial_categories = [
-            "🧹 Быт и уборка",
-            "🧴 Гигиена и уход",
-            "🍳 Дом и кухня",
-            "🥦 Овощи и зелень",
-            "🍎 Фрукты и ягоды",
-            "🥩 Мясо, рыба и птица",
-            "🥛 Молочные продукты и яйца",
-            "🍝 Бакалея",
-            "🥫 Консервы и готовые продукты",
-            "🍬 Сладости и снеки",
-            "🍷 Напитки и алкоголь",
-            "🍼 Детские товары"
-        ]
-        
-        with self._get_connection() as conn:
+        with self._get_connection(immediate=True) as conn:
+            group_id = self._get_user_group(user_id, conn)
             # Add categories
-            for cat in initial_categories:
-                conn.execute(
-                    "INSERT OR IGNORE INTO categories (user_id, group_id, name) VALUES (?, ?, ?)",
-                    (user_id, group_id, cat)
-                )
+            conn.execute(
+                _SEED_CATEGORIES_SQL,
+                [value for cat in _INITIAL_CATEGORIES for value in (user_id, group_id, cat)]
+            )
             
-            # Check if items already exist for this group to avoid double seeding
-            cursor = conn.execute("SELECT COUNT(*) as count FROM items WHERE group_id = ?", (group_id,))
-            if cursor.fetchone()["count"] > 0:
+            # Check if items already exist for this group to avoid double seeding;
+            # stops at the first row instead of counting them all
+            if conn.execute("SELECT 1 FROM items WHERE group_id = ? LIMIT 1", (group_id,)).fetchone():
                 return
 
             # Pre-populate items
-            items_to_seed = [
-                # Быт и уборка
-                ("Пакеты для мусора", "🧹 Быт и уборка"), ("Жидкость для посудомойки", "🧹 Быт и уборка"),
-                ("Таблетки для посудомойки", "🧹 Быт и уборка"), ("Хлорка", "🧹 Быт и уборка"),
-                ("Максима для стирки", "🧹 Быт и уборка"), ("Батарейки", "🧹 Быт и уборка"),
-                
-                # Гигиена и уход
-                ("Мыло для рук", "🧴 Гигиена и уход"), ("Зубная паста", "🧴 Гигиена и уход"),
-                ("Влажные салфетки", "🧴 Гигиена и уход"), ("Ёршики для унитаза", "🧴 Гигиена и уход"),
-                ("Репеллент", "🧴 Гигиена и уход"), ("Прокладки", "🧴 Гигиена и уход"),
-                ("Шампунь", "🧴 Гигиена и уход"), ("Зубные щётки", "🧴 Гигиена и уход"),
-                ("Дезодорант", "🧴 Гигиена и уход"), ("Жидкое мыло", "🧴 Гигиена и уход"),
-                ("Туалетная бумага", "🧴 Гигиена и уход"), ("Бумажные полотенца", "🧴 Гигиена и уход"),
-                ("Детская нить для зубов", "🧴 Гигиена и уход"),
-                
-                # Дом и кухня
-                ("Прихватки", "🍳 Дом и кухня"), ("Сидушка для унитаза", "🍳 Дом и кухня"),
-                ("Контейнеры для хранения", "🍳 Дом и кухня"), ("Фольга", "🍳 Дом и кухня"),
-                ("Дуршлаг", "🍳 Дом и кухня"), ("Силикон формы для запекания", "🍳 Дом и кухня"),
-                ("Бутылка для воды", "🍳 Дом и кухня"),
-                
-                # Овощи и зелень
-                ("Помидоры", "🥦 Овощи и зелень"), ("Картошка", "🥦 Овощи и зелень"),
-                ("Болгарский перец", "🥦 Овощи и зелень"), ("Огурцы свежие", "🥦 Овощи и зелень"),
-                ("Морковь", "🥦 Овощи и зелень"), ("Лук", "🥦 Овощи и зелень"),
-                ("Кукуруза", "🥦 Овощи и зелень"), ("Батат", "🥦 Овощи и зелень"),
-                ("Чеснок", "🥦 Овощи и зелень"), ("Баклажан", "🥦 Овощи и зелень"),
-                ("Свекла", "🥦 Овощи и зелень"), ("Брокколи", "🥦 Овощи и зелень"),
-                ("Руккола", "🥦 Овощи и зелень"), ("Авокадо", "🥦 Овощи и зелень"),
-                ("Кабачки", "🥦 Овощи и зелень"), ("Тыква", "🥦 Овощи и зелень"),
-                ("Капуста", "🥦 Овощи и зелень"), ("Шампиньоны", "🥦 Овощи и зелень"),
-                
-                # Фрукты и ягоды
-                ("Бананы", "🍎 Фрукты и ягоды"), ("Яблоки", "🍎 Фрукты и ягоды"),
-                ("Арбуз", "🍎 Фрукты и ягоды"), ("Груша", "🍎 Фрукты и ягоды"),
-                ("Нектарины", "🍎 Фрукты и ягоды"), ("Дыня", "🍎 Фрукты и ягоды"),
-                ("Виноград", "🍎 Фрукты и ягоды"), ("Чернослив", "🍎 Фрукты и ягоды"),
-                ("Ягоды / заморозка", "🍎 Фрукты и ягоды"), ("Хурма", "🍎 Фрукты и ягоды"),
-                ("Апельсин", "🍎 Фрукты и ягоды"),
-                
-                # Напитки и алкоголь
-                ("Вода", "🍷 Напитки и алкоголь"), ("Вино", "🍷 Напитки и алкоголь"),
-                ("Сок", "🍷 Напитки и алкоголь"), ("Лёд", "🍷 Напитки и алкоголь"),
-                ("Пиво", "🍷 Напитки и алкоголь"), ("Коньяк", "🍷 Напитки и алкоголь"),
-                ("Кофе", "🍷 Напитки и алкоголь"), ("Чай", "🍷 Напитки и алкоголь"),
-                ("Какао", "🍷 Напитки и алкоголь"),
-                
-                # Детские товары
-                ("Пюре", "🍼 Детские товары"), ("Памперсы", "🍼 Детские товары"),
-                ("Памперсы трусики", "🍼 Детские товары"),
-                
-                # Сладости и снеки
-                ("Бамба", "🍬 Сладости и снеки"), ("Маршмэллоу", "🍬 Сладости и снеки"),
-                ("Сахар", "🍬 Сладости и снеки"), ("Темный шоколад", "🍬 Сладости и снеки"),
-                ("Курага", "🍬 Сладости и снеки"), ("Тыквенные семечки", "🍬 Сладости и снеки"),
-                ("К чаю", "🍬 Сладости и снеки"), ("Ванильный сахар", "🍬 Сладости и снеки"),
-                
-                # Бакалея
-                ("Паста", "🍝 Бакалея"), ("Гречка", "🍝 Бакалея"), ("Манка", "🍝 Бакалея"),
-                ("Соль", "🍝 Бакалея"), ("Мука", "🍝 Бакалея"), ("Овсянка", "🍝 Бакалея"),
-                ("Лимонный сок", "🍝 Бакалея"), ("Оливковое масло", "🍝 Бакалея"),
-                ("Рис", "🍝 Бакалея"), ("Киноа", "🍝 Бакалея"), ("Булгур", "🍝 Бакалея"),
-                ("Бурый рис", "🍝 Бакалея"), ("Пшено", "🍝 Бакалея"), ("Хумус", "🍝 Бакалея"),
-                ("Паста для пиццы", "🍝 Бакалея"), ("Чечевица", "🍝 Бакалея"), ("Хлеб", "🍝 Бакалея"),
-                
-                # Консервы и готовые продукты
-                ("Соленые огурцы", "🥫 Консервы и готовые продукты"),
-                ("Консервированная кукуруза", "🥫 Консервы и готовые продукты"),
-                ("Мак (сушеный)", "🥫 Консервы и готовые продукты"),
-                ("Консерв белая фасоль", "🥫 Консервы и готовые продукты"),
-                ("Корица молотая", "🥫 Консервы и готовые продукты"),
-                ("Сардины в банке", "🥫 Консервы и готовые продукты"),
-                ("Оливки", "🥫 Консервы и готовые продукты"),
-                
-                # Молочные продукты и яйца
-                ("Яйца", "🥛 Молочные продукты и яйца"), ("Молоко", "🥛 Молочные продукты и яйца"),
-                ("Сливочное масло", "🥛 Молочные продукты и яйца"), ("Йогурт", "🥛 Молочные продукты и яйца"),
-                ("Сыр", "🥛 Молочные продукты и яйца"), ("Сыр фета", "🥛 Молочные продукты и яйца"),
-                ("Творог", "🥛 Молочные продукты и яйца"), ("Кефир", "🥛 Молочные продукты и яйца"),
-                ("Моцарелла", "🥛 Молочные продукты и яйца"), ("Сливки", "🥛 Молочные продукты и яйца"),
-                
-                # Мясо, рыба и птица
-                ("Мясо", "🥩 Мясо, рыба и птица"), ("Курица", "🥩 Мясо, рыба и птица"),
-                ("Рыба", "🥩 Мясо, рыба и птица"), ("Ветчина", "🥩 Мясо, рыба и птица"),
-                ("Колбаса", "🥩 Мясо, рыба и птица"), ("Печень", "🥩 Мясо, рыба и птица"),
-                ("Индейка", "🥩 Мясо, рыба и птица"), ("Фарш говяжий", "🥩 Мясо, рыба и птица"),
-                ("Сосиски", "🥩 Мясо, рыба и птица")
-            ]
-            
-            for name, dept in items_to_seed:
-                conn.execute(
-                    "INSERT INTO items (user_id, group_id, name, department, is_bought) VALUES (?, ?, ?, ?, 0)",
-                    (user_id, group_id, name, dept)
-                )
+            conn.execute(
+                _SEED_ITEMS_SQL,
+                [value for name, department in _SEED_ITEMS for value in (user_id, group_id, name, department)]
+            )
 
     def get_categories(self, user_id: int) -> List[str]:
         """Get all categories for a user's group."""
-        group_id = self._get_user_group(user_id)
-        with self._get_connection() as conn:
-            cursor = conn.execute(
+        with self._read_connection(user_id) as conn:
+            group_id = self._get_user_group(user_id, conn)
+            rows = conn.execute(
                 "SELECT name FROM categories WHERE group_id = ? ORDER BY id",
                 (group_id,)
             )
-            return [row["name"] for row in cursor.fetchall()]
+            return [row["name"] for row in rows]
 
     def get_categories_with_items(self, user_id: int, include_bought: bool = False) -> List[str]:
         """Get categories that have items in the user's group."""
-        group_id = self._get_user_group(user_id)
-        with self._get_connection() as conn:
+        with self._read_connection(user_id) as conn:
+            group_id = self._get_user_group(user_id, conn)
+            # EXISTS stops at the first matching item per category
             query = """
-                SELECT DISTINCT c.name 
+                SELECT c.name
                 FROM categories c
-                INNER JOIN items i ON c.name = i.department AND c.group_id = i.group_id
-                WHERE c.group_id = ?
+                WHERE c.group_id = ? AND EXISTS (
+                    SELECT 1 FROM items i
+                    WHERE i.group_id = c.group_id AND i.department = c.name
             """
-            params = [group_id]
             
             if not include_bought:
                 query += " AND i.is_bought = 0"
             
-            query += " ORDER BY c.id"
+            query += ") ORDER BY c.id"
             
-            cursor = conn.execute(query, params)
-            return [row["name"] for row in cursor.fetchall()]
+            return [row["name"] for row in conn.execute(query, (group_id,))]
 
     def add_category(self, user_id: int, name: str) -> bool:
         """Add a new category to user's group."""
-        group_id = self._get_user_group(user_id)
         try:
-            with self._get_connection() as conn:
+            with self._get_connection(immediate=True) as conn:
+                group_id = self._get_user_group(user_id, conn)
                 conn.execute(
                     "INSERT INTO categories (user_id, group_id, name) VALUES (?, ?, ?)",
                     (user_id, group_id, name)
@@ -357,8 +445,8 @@ class Database:
 
     def delete_category(self, user_id: int, name: str) -> Tuple[bool, int]:
         """Delete a category and all its items from user's group."""
-        group_id = self._get_user_group(user_id)
-        with self._get_connection() as conn:
+        with self._get_connection(immediate=True) as conn:
+            group_id = self._get_user_group(user_id, conn)
             # First, delete all items in this category
             cursor = conn.execute(
                 "DELETE FROM items WHERE group_id = ? AND department = ?",
@@ -367,17 +455,17 @@ class Database:
             items_deleted = cursor.rowcount
             
             # Then delete the category
-            cursor = conn.execute(
-                "DELETE FROM categories WHERE group_id = ? AND name = ?",
+            row = conn.execute(
+                "DELETE FROM categories WHERE group_id = ? AND name = ? RETURNING id",
                 (group_id, name)
-            )
-            return (cursor.rowcount > 0, items_deleted)
+            ).fetchone()
+            return (row is not None, items_deleted)
     
     def rename_category(self, user_id: int, old_name: str, new_name: str) -> bool:
         """Rename a category in user's group."""
-        group_id = self._get_user_group(user_id)
         try:
-            with self._get_connection() as conn:
+            with self._get_connection(immediate=True) as conn:
+                group_id = self._get_user_group(user_id, conn)
                 # Update category name
                 conn.execute(
                     "UPDATE categories SET name = ? WHERE group_id = ? AND name = ?",
@@ -393,79 +481,168 @@ class Database:
         except sqlite3.IntegrityError:
             return False
     
-    def get_items(self, user_id: int, include_bought: bool = False) -> List[Dict]:
-        """Get all items for a user's group."""
-        group_id = self._get_user_group(user_id)
-        with self._get_connection() as conn:
-            query = "SELECT * FROM items WHERE group_id = ?"
+    def get_items(self, user_id: int, include_bought: bool = False, category: Optional[str] = None) -> List[Item]:
+        """Get items for a user's group, optionally limited to one category."""
+        with self._read_connection(user_id) as conn:
+            group_id = self._get_user_group(user_id, conn)
+            query = "SELECT id, name, department, is_bought FROM items WHERE group_id = ?"
             params = [group_id]
             
+            if category is not None:
+                query += " AND department = ?"
+                params.append(category)
+            
             if not include_bought:
                 query += " AND is_bought = 0"
             
             query += " ORDER BY name COLLATE NOCASE"
             
-            cursor = conn.execute(query, params)
-            return [dict(row) for row in cursor.fetchall()]
+            cursor = conn.cursor()
+            cursor.row_factory = _item_factory
+            return cursor.execute(query, params).fetchall()
+    
+    def count_items(self, user_id: int, department: str) -> int:
+        """Count items (bought or not) in one category of the user's group."""
+        with self._read_connection(user_id) as conn:
+            group_id = self._get_user_group(user_id, conn)
+            return conn.execute(
+                "SELECT COUNT(*) FROM items WHERE group_id = ? AND department = ?",
+                (group_id, department)
+            ).fetchone()[0]
+
+    def get_items_grouped(self, user_id: int, include_bought: bool = False) -> List[Item]:
+        """Get items for a user's group ordered by category, then by name.
+        
+        Items whose department has no matching category are left out.
+        """
+        with self._read_connection(user_id) as conn:
+            group_id = self._get_user_group(user_id, conn)
+            query = """
+                SELECT i.id, i.name, i.department, i.is_bought
+                FROM items i
+                INNER JOIN categories c ON c.name = i.department AND c.group_id = i.group_id
+                WHERE i.group_id = ?
+            """
+            params = [group_id]
+            
+            if not include_bought:
+                query += " AND i.is_bought = 0"
+            
+            query += " ORDER BY c.id, i.name COLLATE NOCASE"
+            
+            cursor = conn.cursor()
+            cursor.row_factory = _item_factory
+            return cursor.execute(query, params).fetchall()
     
     def add_item(self, user_id: int, name: str, department: str) -> bool:
         """Add a new item to the user's group shopping list."""
-        group_id = self._get_user_group(user_id)
         try:
-            with self._get_connection() as conn:
-                conn.execute(
-                    "INSERT INTO items (user_id, group_id, name, department, is_bought) VALUES (?, ?, ?, ?, 0)",
-                    (user_id, group_id, name, department)
-                )
-                return True
+            return self.add_items(user_id, [(name, department)]) == 1
         except Exception:
             return False
     
+    def add_items(self, user_id: int, pairs) -> int:
+        """Add several (name, department) items in one transaction.
+        
+        Returns:
+            Number of items added
+        """
+        with self._get_connection(immediate=True) as conn:
+            group_id = self._get_user_group(user_id, conn)
+            return self._add_items(conn, user_id, group_id, pairs)
+    
+    def _add_items(self, conn, user_id: int, group_id: int, pairs) -> int:
+        """Insert (name, department) items on an open connection."""
+        cursor = conn.executemany(
+            "INSERT INTO items (user_id, group_id, name, department, is_bought) VALUES (?, ?, ?, ?, 0)",
+            [(user_id, group_id, name, department) for name, department in pairs]
+        )
+        return cursor.rowcount
+    
     def toggle_bought(self, item_id: int, user_id: int) -> bool:
         """Toggle the bought status of an item in user's group."""
-        group_id = self._get_user_group(user_id)
-        with self._get_connection() as conn:
-            cursor = conn.execute(
-                "SELECT is_bought FROM items WHERE id = ? AND group_id = ?",
-                (item_id, group_id)
-            )
-            row = cursor.fetchone()
-            if not row:
-                return False
-            
-            new_status = 0 if row["is_bought"] else 1
-            conn.execute(
-                "UPDATE items SET is_bought = ? WHERE id = ? AND group_id = ?",
-                (new_status, item_id, group_id)
-            )
-            return bool(new_status)
+        with self._get_connection(immediate=True) as conn:
+            group_id = self._get_user_group(user_id, conn)
+            return self._toggle_bought(conn, item_id, group_id)
     
+    def _toggle_bought(self, conn, item_id: int, group_id: int) -> bool:
+        """Toggle the bought status of an item on an open connection."""
+        # Single statement; RETURNING needs SQLite 3.35+
+        row = conn.execute(
+            "UPDATE items SET is_bought = 1 - is_bought WHERE id = ? AND group_id = ? RETURNING is_bought",
+            (item_id, group_id)
+        ).fetchone()
+        return bool(row["is_bought"]) if row else False
+
+    def toggle_bought_many(self, user_id: int, item_ids: List[int]) -> Dict[int, bool]:
+        """Toggle the bought status of several items with one UPDATE.
+
+        Each id is toggled once, even if repeated.
+
+        Returns:
+            New bought status keyed by item id; ids not in the group are left out
+        """
+        if not item_ids:
+            return {}
+        placeholders = ", ".join("?" * len(item_ids))
+        with self._get_connection(immediate=True) as conn:
+            group_id = self._get_user_group(user_id, conn)
+            rows = conn.execute(
+                f"UPDATE items SET is_bought = 1 - is_bought WHERE group_id = ? AND id IN ({placeholders}) "
+                "RETURNING id, is_bought",
+                (group_id, *item_ids)
+            )
+            return {row["id"]: bool(row["is_bought"]) for row in rows}
+
     def delete_item(self, item_id: int, user_id: int) -> bool:
         """Delete an item from user's group."""
-        group_id = self._get_user_group(user_id)
-        with self._get_connection() as conn:
-            cursor = conn.execute(
-                "DELETE FROM items WHERE id = ? AND group_id = ?",
-                (item_id, group_id)
-            )
-            return cursor.rowcount > 0
+        with self._get_connection(immediate=True) as conn:
+            group_id = self._get_user_group(user_id, conn)
+            return self._delete_item(conn, item_id, group_id)
+    
+    def _delete_item(self, conn, item_id: int, group_id: int) -> bool:
+        """Delete an item on an open connection."""
+        row = conn.execute(
+            "DELETE FROM items WHERE id = ? AND group_id = ? RETURNING id",
+            (item_id, group_id)
+        ).fetchone()
+        return row is not None
+    
+    def apply_mutations(self, mutations: List[Tuple[str, tuple]]) -> List:
+        """Apply several item mutations in a single write transaction.
+        
+        Args:
+            mutations: List of (op, (item_id, user_id)) where op is "toggle" or "delete"
+        
+        Returns:
+            Results in the same order as the corresponding single-item methods
+        """
+        handlers = {"toggle": self._toggle_bought, "delete": self._delete_item}
+        with self._get_connection(immediate=True) as conn:
+            return [handlers[op](conn, item_id, self._get_user_group(user_id, conn))
+                    for op, (item_id, user_id) in mutations]
     
     def clear_bought_items(self, user_id: int) -> int:
         """Delete all bought items for a user's group."""
-        group_id = self._get_user_group(user_id)
-        with self._get_connection() as conn:
+        with self._get_connection(immediate=True) as conn:
+            group_id = self._get_user_group(user_id, conn)
             cursor = conn.execute(
                 "DELETE FROM items WHERE group_id = ? AND is_bought = 1",
                 (group_id,)
             )
-            return cursor.rowcount
+            deleted = cursor.rowcount
+        if deleted:
+            with self._lock:
+                # Reclaim up to 64 free pages; execute() would only step the pragma once
+                self._conn.executescript("PRAGMA incremental_vacuum(64);")
+        return deleted
     
     def update_item_name(self, item_id: int, user_id: int, name: str) -> bool:
         """Update an item's name in user's group."""
-        group_id = self._get_user_group(user_id)
-        with self._get_connection() as conn:
-            cursor = conn.execute(
-                "UPDATE items SET name = ? WHERE id = ? AND group_id = ?",
+        with self._get_connection(immediate=True) as conn:
+            group_id = self._get_user_group(user_id, conn)
+            row = conn.execute(
+                "UPDATE items SET name = ? WHERE id = ? AND group_id = ? RETURNING id",
                 (name, item_id, group_id)
-            )
-            return cursor.rowcount > 0
+            ).fetchone()
+            return row is not None